@@ -1,18 +1,25 @@
 import pandas as pd
 import streamlit as st
 from PIL import Image
-import numpy as np
 from datetime import datetime
 
-# Page configuration
-st.set_page_config(
-    page_title="Análisis de Sensores - Mi Ciudad",
-    page_icon="🛢️",
-    layout="wide"
+from utils import (
+    LARGE_DOWNLOAD_ROWS,
+    compute_bounds,
+    compute_histogram,
+    compute_stats,
+    downsample,
+    filter_above,
+    filter_below,
+    filter_between,
+    load_and_prepare,
+    preview,
+    to_csv_bytes,
+    to_parquet_bytes,
 )
 
 # Custom CSS: tema oscuro con acentos "gas" (amarillo/dorado) y pequeña estética de tarjetas
-st.markdown("""
+_CSS = """
     <style>
     /* Fondo general */
     .stApp {
@@ -99,7 +106,17 @@ st.markdown("""
         padding-top:10px;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+# Page configuration
+st.set_page_config(
+    page_title="Análisis de Sensores - Mi Ciudad",
+    page_icon="🛢️",
+    layout="wide"
+)
+
+# Custom CSS
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # Title and description (gas-themed emojis and wording)
 st.title('🛢️📊  Análisis de datos de Sensores - Gas urbano')
@@ -120,60 +137,206 @@ eafit_location = pd.DataFrame({
 st.subheader("📍 Ubicación de los Sensores - ENVIGADO / ZUÑIGA")
 st.map(eafit_location, zoom=15)
 
+
+def report_error(e: Exception) -> None:
+    """Mensaje de error común para la carga y para los fragmentos.
+
+    Un fragmento que se re-ejecuta solo no pasa por el try/except del
+    script principal, así que cada uno lo captura por su cuenta.
+    """
+    st.error(f'Error al procesar el archivo: {str(e)}')
+    st.info('Asegúrese de que el archivo CSV tenga al menos una columna con datos.')
+
+
+# (mínimo, máximo, promedio, percentiles P5/P50/P95) de la variable
+SliderBounds = tuple[float, float, float, tuple[float, ...]]
+
+
+def slider_bounds(df: pd.DataFrame, file_id: str) -> SliderBounds:
+    """Límites de los sliders, guardados en session_state por archivo.
+
+    Solo dependen del archivo, no de los sliders: cada rerun los lee de
+    session_state sin volver a hashear el DataFrame. Subir otro archivo
+    cambia `file_id` y obliga a recalcularlos.
+    """
+    if st.session_state.get("bounds_file_id") != file_id:
+        stats = compute_stats(df, file_id)
+        percentiles = (float(stats['5%']), float(stats['50%']), float(stats['95%']))
+        st.session_state.bounds = compute_bounds(df, file_id) + (percentiles,)
+        st.session_state.bounds_file_id = file_id
+    return st.session_state.bounds
+
+
+def percentiles_help(percentiles: tuple[float, ...]) -> str:
+    """Texto de ayuda de los sliders con los percentiles de referencia."""
+    p5, p50, p95 = percentiles
+    return f"Referencia: P5 = {p5:.2f} · P50 = {p50:.2f} · P95 = {p95:.2f}"
+
+
+# Por lado del filtro: etiqueta del slider, texto de la tabla y función de filtro
+FILTER_SIDES = {
+    'min': ('Valor mínimo', 'superior a', filter_above),
+    'max': ('Valor máximo', 'inferior a', filter_below),
+}
+
+
+def value_filter(
+    df: pd.DataFrame,
+    file_id: str,
+    bounds: SliderBounds,
+    side: str,
+    show_table: bool
+) -> None:
+    """Slider de un lado del filtro ('min' o 'max') y, opcionalmente, su tabla."""
+    label, text, filter_rows = FILTER_SIDES[side]
+    min_value, max_value, mean_value, percentiles = bounds
+    value = st.slider(
+        label,
+        min_value,
+        max_value,
+        mean_value,
+        key=f"{side}_val",
+        help=percentiles_help(percentiles)
+    )
+
+    if show_table:
+        st.write(f"Registros con valor {text} {value:.2f}:")
+        preview(df, filter_rows(df, file_id, value))
+
+
+@st.fragment
+def value_filter_fragment(df: pd.DataFrame, file_id: str, bounds: SliderBounds, side: str) -> None:
+    try:
+        value_filter(df, file_id, bounds, side, show_table=True)
+    except Exception as e:
+        report_error(e)
+
+
+@st.fragment
+def render_visualizacion(df: pd.DataFrame, file_id: str) -> None:
+    """Contenido de la pestaña 📈; sus widgets solo re-ejecutan esta pestaña."""
+    try:
+        st.subheader('📈 Visualización de Datos')
+
+        # Chart type selector
+        chart_type = st.selectbox(
+            "Seleccione tipo de gráfico",
+            ["Línea", "Área", "Barra", "Histograma"]
+        )
+
+        # Create plot based on selection (serie reducida para el navegador)
+        if chart_type == "Histograma":
+            st.bar_chart(compute_histogram(df, file_id))
+        else:
+            chart_data = downsample(df["variable"])
+            if chart_type == "Línea":
+                st.line_chart(chart_data)
+            elif chart_type == "Área":
+                st.area_chart(chart_data)
+            else:
+                st.bar_chart(chart_data)
+
+        # Raw data display with toggle
+        if st.checkbox('🔎 Mostrar datos crudos'):
+            st.write(df)
+    except Exception as e:
+        report_error(e)
+
+
+@st.fragment
+def render_filtros(df: pd.DataFrame, file_id: str) -> None:
+    """Contenido de la pestaña 🔍; sus widgets solo re-ejecutan esta pestaña."""
+    try:
+        st.subheader('🔍 Filtros de Datos')
+
+        # Calcular rango de valores
+        bounds = slider_bounds(df, file_id)
+        min_value, max_value = bounds[0], bounds[1]
+
+        # Verificar si hay variación en los datos
+        if min_value == max_value:
+            st.warning(f"⚠️ Todos los valores en el dataset son iguales: {min_value:.2f}")
+            st.info("No es posible aplicar filtros cuando no hay variación en los datos.")
+            preview(df)
+        else:
+            # Con ambos filtros combinados solo se calcula el rango final
+            combinar = st.checkbox('🔗 Combinar filtros (mínimo y máximo)')
+
+            col1, col2 = st.columns(2)
+
+            # Sin combinar, cada columna es un fragmento: mover un slider
+            # solo vuelve a ejecutar (y enviar) su propia tabla. Mientras se
+            # muestra el botón de descarga no se usan fragmentos, para que
+            # mover un slider re-ejecute toda la pestaña y quite el botón
+            # (sus datos corresponden a los valores anteriores)
+            descargando = st.session_state.get("descargar", False)
+            for col, side in ((col1, 'min'), (col2, 'max')):
+                with col:
+                    if combinar:
+                        value_filter(df, file_id, bounds, side, show_table=False)
+                    elif descargando:
+                        value_filter(df, file_id, bounds, side, show_table=True)
+                    else:
+                        value_filter_fragment(df, file_id, bounds, side)
+
+            min_val = st.session_state["min_val"]
+            max_val = st.session_state["max_val"]
+
+            if combinar:
+                # Una sola máscara (mínimo & máximo), sin concatenar resultados
+                posiciones = filter_between(df, file_id, min_val, max_val)
+                st.write(f"Registros con valor entre {min_val:.2f} y {max_val:.2f}:")
+                preview(df, posiciones)
+
+            # Download filtered data: solo se codifica el formato elegido.
+            # Para archivos grandes se sugiere Parquet (más liviano y rápido)
+            formato = st.radio(
+                'Formato de descarga',
+                ['Parquet', 'CSV'],
+                index=0 if len(df) > LARGE_DOWNLOAD_ROWS else 1,
+                horizontal=True
+            )
+            if st.button('⬇️ Descargar datos filtrados', key="descargar"):
+                if not combinar:
+                    posiciones = filter_above(df, file_id, min_val)
+                filtrado_completo = df.iloc[posiciones]
+                if formato == 'Parquet':
+                    st.download_button(
+                        label="Descargar Parquet",
+                        data=to_parquet_bytes(filtrado_completo),
+                        file_name='datos_filtrados.parquet',
+                        mime='application/vnd.apache.parquet',
+                    )
+                else:
+                    st.download_button(
+                        label="Descargar CSV",
+                        data=to_csv_bytes(filtrado_completo),
+                        file_name='datos_filtrados.csv',
+                        mime='text/csv',
+                    )
+    except Exception as e:
+        report_error(e)
+
+
 # File uploader
 uploaded_file = st.file_uploader('📁 Seleccione archivo CSV con lecturas', type=['csv'])
 
 if uploaded_file is not None:
     try:
-        # Load and process data
-        df1 = pd.read_csv(uploaded_file)
-        
-        # Renombrar la columna a 'variable'
-        # Asume que la primera columna después de 'Time' es la variable de interés
-        # O busca una columna específica y la renombra
-        if 'Time' in df1.columns:
-            # Si existe Time, renombrar la otra columna a 'variable'
-            other_columns = [col for col in df1.columns if col != 'Time']
-            if len(other_columns) > 0:
-                df1 = df1.rename(columns={other_columns[0]: 'variable'})
-        else:
-            # Si no existe Time, renombrar la primera columna a 'variable'
-            df1 = df1.rename(columns={df1.columns[0]: 'variable'})
-        
-        # Procesar columna de tiempo si existe
-        if 'Time' in df1.columns:
-            df1['Time'] = pd.to_datetime(df1['Time'])
-            df1 = df1.set_index('Time')
+        # Load and process data (cacheado entre reruns)
+        df1 = load_and_prepare(uploaded_file.getvalue())
 
         # Create tabs for different analyses
         tab1, tab2, tab3, tab4 = st.tabs(["📈 Visualización", "📊 Estadísticas", "🔍 Filtros", "🗺️ Información del Sitio"])
 
         with tab1:
-            st.subheader('📈 Visualización de Datos')
-            
-            # Chart type selector
-            chart_type = st.selectbox(
-                "Seleccione tipo de gráfico",
-                ["Línea", "Área", "Barra"]
-            )
-            
-            # Create plot based on selection
-            if chart_type == "Línea":
-                st.line_chart(df1["variable"])
-            elif chart_type == "Área":
-                st.area_chart(df1["variable"])
-            else:
-                st.bar_chart(df1["variable"])
-
-            # Raw data display with toggle
-            if st.checkbox('🔎 Mostrar datos crudos'):
-                st.write(df1)
+            render_visualizacion(df1, uploaded_file.file_id)
 
         with tab2:
             st.subheader('📊 Análisis Estadístico')
             
             # Statistical summary
-            stats_df = df1["variable"].describe()
+            stats_df = compute_stats(df1, uploaded_file.file_id)
             
             col1, col2 = st.columns(2)
             
@@ -188,58 +351,7 @@ if uploaded_file is not None:
                 st.metric("Desviación Estándar", f"{stats_df['std']:.2f}")
 
         with tab3:
-            st.subheader('🔍 Filtros de Datos')
-            
-            # Calcular rango de valores
-            min_value = float(df1["variable"].min())
-            max_value = float(df1["variable"].max())
-            mean_value = float(df1["variable"].mean())
-            
-            # Verificar si hay variación en los datos
-            if min_value == max_value:
-                st.warning(f"⚠️ Todos los valores en el dataset son iguales: {min_value:.2f}")
-                st.info("No es posible aplicar filtros cuando no hay variación en los datos.")
-                st.dataframe(df1)
-            else:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Minimum value filter
-                    min_val = st.slider(
-                        'Valor mínimo',
-                        min_value,
-                        max_value,
-                        mean_value,
-                        key="min_val"
-                    )
-                    
-                    filtrado_df_min = df1[df1["variable"] > min_val]
-                    st.write(f"Registros con valor superior a {min_val:.2f}:")
-                    st.dataframe(filtrado_df_min)
-                    
-                with col2:
-                    # Maximum value filter
-                    max_val = st.slider(
-                        'Valor máximo',
-                        min_value,
-                        max_value,
-                        mean_value,
-                        key="max_val"
-                    )
-                    
-                    filtrado_df_max = df1[df1["variable"] < max_val]
-                    st.write(f"Registros con valor inferior a {max_val:.2f}:")
-                    st.dataframe(filtrado_df_max)
-
-                # Download filtered data
-                if st.button('⬇️ Descargar datos filtrados'):
-                    csv = filtrado_df_min.to_csv().encode('utf-8')
-                    st.download_button(
-                        label="Descargar CSV",
-                        data=csv,
-                        file_name='datos_filtrados.csv',
-                        mime='text/csv',
-                    )
+            render_filtros(df1, uploaded_file.file_id)
 
         with tab4:
             st.subheader("🗺️ Información del Sitio de Medición")
@@ -261,8 +373,7 @@ if uploaded_file is not None:
                 st.write("- Ubicación: Campus universitario")
 
     except Exception as e:
-        st.error(f'Error al procesar el archivo: {str(e)}')
-        st.info('Asegúrese de que el archivo CSV tenga al menos una columna con datos.')
+        report_error(e)
 else:
     st.warning('⚠️ Por favor, cargue un archivo CSV para comenzar el análisis.')
     
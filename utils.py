@@ -0,0 +1,187 @@
+"""Carga y cálculos compartidos por las páginas de la aplicación.
+
+Las funciones cacheadas viven aquí para que su memoria se comparta entre
+páginas: cada CSV subido se parsea una sola vez en el servidor.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow.csv as pa_csv
+import streamlit as st
+
+# A partir de este número de filas se sugiere descargar en Parquet
+LARGE_DOWNLOAD_ROWS = 100_000
+
+# Los cachés que guardan datos del archivo completo (DataFrame y arreglos) se
+# limitan a unos pocos archivos y se liberan pasada una hora para no retener
+# memoria de cada subida durante toda la vida del proceso
+RESOURCE_MAX_ENTRIES = 4
+RESOURCE_TTL = 3600
+
+
+def variable_position(names: list[str], time_pos: int | None) -> int | None:
+    """Posición de la variable de interés dentro de los encabezados.
+
+    Es la primera columna distinta de 'Time'. Una primera columna sin nombre
+    es el índice que escribe `DataFrame.to_csv` (por ejemplo, las descargas
+    de esta misma app) y se salta si hay otra columna disponible.
+    """
+    candidates = [i for i in range(len(names)) if i != time_pos]
+    if time_pos is None and len(candidates) > 1 and names[0] == '':
+        candidates = candidates[1:]
+    return candidates[0] if candidates else None
+
+
+@st.cache_data(show_spinner=False, max_entries=RESOURCE_MAX_ENTRIES, ttl=RESOURCE_TTL)
+def load_and_prepare(file_bytes: bytes) -> pd.DataFrame:
+    """Lee el CSV subido y lo deja listo para el análisis.
+
+    Se cachea por el contenido del archivo, así los reruns de Streamlit
+    (sliders, checkboxes, cambio de pestaña) no vuelven a parsear el CSV.
+    """
+    # Encabezados tal como los lee pyarrow: los vacíos o repetidos se
+    # conservan, por eso todo lo que sigue trabaja por posición
+    names = pa_csv.open_csv(io.BytesIO(file_bytes)).schema.names
+    time_pos = names.index('Time') if 'Time' in names else None
+    var_pos = variable_position(names, time_pos)
+
+    # Solo se cargan 'Time' y la variable de interés, para no materializar en
+    # memoria columnas que el análisis no usa. pyarrow parsea en paralelo y ya
+    # infiere las fechas ISO; los nombres provisionales permiten elegir las
+    # columnas por posición aunque los encabezados estén vacíos o repetidos
+    positions = [pos for pos in (time_pos, var_pos) if pos is not None]
+    placeholders = [str(i) for i in range(len(names))]
+    table = pa_csv.read_csv(
+        io.BytesIO(file_bytes),
+        read_options=pa_csv.ReadOptions(column_names=placeholders, skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=[placeholders[pos] for pos in positions]
+        )
+    )
+    df = table.to_pandas()
+    df.columns = ['variable' if pos == var_pos else names[pos] for pos in positions]
+
+    # Procesar columna de tiempo si existe
+    if 'Time' in df.columns:
+        if not pd.api.types.is_datetime64_any_dtype(df['Time']):
+            df['Time'] = pd.to_datetime(df['Time'], errors='coerce')
+        df = df.set_index('Time').sort_index()
+
+    if not pd.api.types.is_numeric_dtype(df['variable']):
+        df['variable'] = pd.to_numeric(df['variable'], errors='coerce')
+    return df
+
+
+@st.cache_resource(show_spinner=False, max_entries=RESOURCE_MAX_ENTRIES, ttl=RESOURCE_TTL)
+def variable_values(_df: pd.DataFrame, file_id: str) -> np.ndarray:
+    """Valores de 'variable' como arreglo NumPy contiguo, alineado con las filas.
+
+    Se comparte entre reruns sin copiarse (cache_resource), por lo que no
+    debe modificarse. La clave es `file_id`; el DataFrame no se hashea.
+    Los cálculos numéricos trabajan sobre este arreglo y el índice de tiempo
+    solo se usa al mostrar un DataFrame.
+    """
+    values = np.ascontiguousarray(_df['variable'].to_numpy(dtype=np.float64))
+    values.flags.writeable = False
+    return values
+
+
+@st.cache_data(show_spinner=False)
+def compute_stats(_df: pd.DataFrame, file_id: str) -> pd.Series:
+    """Resumen estadístico de 'variable'.
+
+    Equivale a `Series.describe(percentiles=[.05, .25, .5, .75, .95])`: los
+    percentiles 5 y 95 sirven de referencia para los sliders. Todos los
+    cuantiles, el mínimo y el máximo salen de una sola llamada a
+    `np.quantile` (selección parcial, sin ordenar todo el arreglo).
+    """
+    values = variable_values(_df, file_id)
+    valid = values[~np.isnan(values)]
+    index = ['count', 'mean', 'std', 'min', '5%', '25%', '50%', '75%', '95%', 'max']
+    if valid.size == 0:
+        return pd.Series([0.0] + [np.nan] * 9, index=index, name='variable')
+
+    mean = valid.mean()
+    std = valid.std(ddof=1) if valid.size > 1 else np.nan
+    quantiles = np.quantile(valid, [0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0])
+    return pd.Series(
+        [float(valid.size), mean, std, *quantiles],
+        index=index,
+        name='variable'
+    )
+
+
+@st.cache_data(show_spinner=False)
+def compute_bounds(_df: pd.DataFrame, file_id: str) -> tuple[float, float, float]:
+    """Mínimo, máximo y promedio de 'variable' para los sliders (cacheado).
+
+    Se toman del resumen de `compute_stats`, así que no recorren el arreglo
+    otra vez; comparar mínimo y máximo basta para detectar datos sin variación.
+    """
+    stats = compute_stats(_df, file_id)
+    return float(stats['min']), float(stats['max']), float(stats['mean'])
+
+
+def filter_above(df: pd.DataFrame, file_id: str, min_val: float) -> np.ndarray:
+    """Posiciones (en orden original) de las filas con 'variable' > min_val."""
+    return np.flatnonzero(variable_values(df, file_id) > min_val)
+
+
+def filter_below(df: pd.DataFrame, file_id: str, max_val: float) -> np.ndarray:
+    """Posiciones (en orden original) de las filas con 'variable' < max_val."""
+    return np.flatnonzero(variable_values(df, file_id) < max_val)
+
+
+def filter_between(df: pd.DataFrame, file_id: str, min_val: float, max_val: float) -> np.ndarray:
+    """Posiciones de las filas con min_val < 'variable' < max_val."""
+    values = variable_values(df, file_id)
+    return np.flatnonzero((values > min_val) & (values < max_val))
+
+
+def downsample(series: pd.Series, target: int = 4000) -> pd.Series:
+    """Reduce la serie a ~`target` puntos para graficarla.
+
+    El navegador no puede mostrar más puntos que píxeles, así que enviar la
+    serie completa solo agranda el mensaje al frontend.
+    """
+    if len(series) <= target:
+        return series
+    return series.iloc[::len(series) // target]
+
+
+@st.cache_data(show_spinner=False)
+def compute_histogram(_df: pd.DataFrame, file_id: str, bins: int = 30) -> pd.Series:
+    """Conteo por intervalo de 'variable', indexado por el borde inferior."""
+    values = variable_values(_df, file_id)
+    counts, edges = np.histogram(values[~np.isnan(values)], bins=bins)
+    return pd.Series(counts, index=edges[:-1])
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """CSV codificado para la descarga (cacheado por contenido del filtro)."""
+    return df.to_csv().encode('utf-8')
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    """Parquet comprimido con zstd para la descarga (cacheado)."""
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, engine='pyarrow', compression='zstd')
+    return buffer.getvalue()
+
+
+def preview(df: pd.DataFrame, positions: np.ndarray | None = None, n: int = 200) -> None:
+    """Muestra las primeras `n` filas; el resto no se envía al navegador.
+
+    Con `positions` (salida de los filtros) solo se copian esas `n` filas,
+    nunca el DataFrame filtrado completo.
+    """
+    if positions is None:
+        rows, total = df.head(n), len(df)
+    else:
+        rows, total = df.iloc[positions[:n]], len(positions)
+    st.dataframe(rows)
+    if total > n:
+        st.caption(f"Mostrando {n} de {total} registros.")